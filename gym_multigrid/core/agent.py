@@ -100,6 +100,13 @@ class Agent(WorldObj):
         )
 
     def encode(self, current_agent=False):
+        """
+        Encode the agent without caching: its state changes nearly every step
+        and the encoding depends on the carried object
+        """
+        return self._encode(current_agent)
+
+    def _encode(self, current_agent=False):
         """Encode the a description of this object as a 3-tuple of integers"""
         if self.world.encode_dim == 3:
             return (
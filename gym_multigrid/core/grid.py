@@ -1,19 +1,100 @@
+from collections import OrderedDict
 from typing import Callable, Type
 import numpy as np
+from numpy.typing import NDArray
 
 from gym_multigrid.core.world import WorldT
+from ..utils.jit import NUMBA_AVAILABLE, njit, prange
 from ..utils.rendering import *
 from .object import WorldObj, Wall, WorldObjT
 from .constants import TILE_PIXELS
 
 
+@njit(cache=True)
+def _propagate_vis(see_behind: NDArray, ax: int, ay: int) -> NDArray:
+    """
+    Flood the visibility mask from the agent position, row by row
+
+    Parameters
+    ----------
+    see_behind : NDArray
+        (width, height) boolean array, True where the agent can see past the cell.
+    ax, ay : int
+        Position of the agent in the grid.
+
+    Returns
+    -------
+    mask : NDArray
+        (width, height) boolean array of visible cells.
+    """
+
+    width, height = see_behind.shape
+    mask = np.zeros((width, height), dtype=np.bool_)
+
+    mask[ax, ay] = True
+
+    for j in range(height - 1, -1, -1):
+        for i in range(0, width - 1):
+            if not mask[i, j] or not see_behind[i, j]:
+                continue
+
+            mask[i + 1, j] = True
+            if j > 0:
+                mask[i + 1, j - 1] = True
+                mask[i, j - 1] = True
+
+        for i in range(width - 1, 0, -1):
+            if not mask[i, j] or not see_behind[i, j]:
+                continue
+
+            mask[i - 1, j] = True
+            if j > 0:
+                mask[i - 1, j - 1] = True
+                mask[i, j - 1] = True
+
+    return mask
+
+
+@njit(parallel=True, cache=True)
+def _compose_tiles(img: NDArray, tiles: NDArray, tile_index: NDArray) -> None:
+    """
+    Copy tiles into a frame, parallelized over rows of tiles
+
+    Parameters
+    ----------
+    img : NDArray
+        (height * tile_size, width * tile_size, 3) frame written in place.
+    tiles : NDArray
+        (n_tiles, tile_size, tile_size, 3) distinct tiles.
+    tile_index : NDArray
+        (height, width) index in `tiles` of the tile drawn in each cell.
+    """
+
+    height, width = tile_index.shape
+    tile_size = tiles.shape[1]
+
+    # Explicit element loops compile to plain copies, unlike slice assignments
+    # which create an array view per tile
+    for j in prange(height):
+        for i in range(width):
+            tile = tiles[tile_index[j, i]]
+            for y in range(tile_size):
+                for x in range(tile_size):
+                    for c in range(3):
+                        img[j * tile_size + y, i * tile_size + x, c] = tile[y, x, c]
+
+
 class Grid:
     """
     Represent a grid and operations on it
     """
 
-    # Static cache of pre-renderer tiles
-    tile_cache = {}
+    # Static LRU cache of pre-rendered tiles, bounded by `tile_cache_maxsize`
+    tile_cache: OrderedDict[int | tuple, NDArray] = OrderedDict()
+    tile_cache_maxsize: int = 4096
+
+    # Empty, non-highlighted tiles by tile size, kept outside of the LRU cache
+    empty_tiles: dict[int, NDArray] = {}
 
     def __init__(self, width: int, height: int, world: WorldT):
         assert width >= 3
@@ -23,17 +104,20 @@ class Grid:
         self.height = height
         self.world = world
 
-        self.grid: list[WorldObjT | None] = [None] * width * height
+        self.grid: NDArray = np.empty((width, height), dtype=object)
+
+        # Occupancy mask kept in sync with `grid`, used to vectorize grid ops.
+        # Object attributes are always read from the objects themselves since
+        # they can change in place.
+        self._occupied = np.zeros((width, height), dtype=bool)
 
     def __contains__(self, key: type[WorldObjT] | tuple) -> bool:
+        # Only occupied cells are visited; type and color are read from the
+        # objects since they can be reassigned in place
         if isinstance(key, WorldObj):
-            for e in self.grid:
-                if e is key:
-                    return True
+            return any(e is key for e in self.grid[self._occupied])
         elif isinstance(key, tuple):
-            for e in self.grid:
-                if e is None:
-                    continue
+            for e in self.grid[self._occupied]:
                 if (e.color, e.type) == key:
                     return True
                 if key[0] is None and key[1] == e.type:
@@ -41,27 +125,65 @@ class Grid:
         return False
 
     def __eq__(self, other: "Grid") -> bool:
-        grid1 = self.encode()
-        grid2 = other.encode()
-        return np.array_equal(grid2, grid1)
+        if self.width != other.width or self.height != other.height:
+            return False
+
+        # Empty cells encode identically, so only occupied cells need encoding
+        if not np.array_equal(self._occupied, other._occupied):
+            return False
+
+        xs, ys = np.nonzero(self._occupied)
+        return all(
+            self.grid[i, j].encode() == other.grid[i, j].encode()
+            for i, j in zip(xs, ys)
+        )
 
     def __ne__(self, other: "Grid") -> bool:
         return not self == other
 
     def copy(self) -> "Grid":
-        from copy import deepcopy
+        """
+        Copy the grid, cloning the objects it holds
+
+        Each object is cloned with `WorldObj.clone`, so changing the state of
+        a cell of the copy (e.g. toggling a door or moving a ball) does not
+        affect this grid. Clones are shallow: they share the world and the
+        objects they reference, such as `Box.contains` and `Agent.carrying`,
+        with the originals. An object placed in several cells maps to a
+        single clone.
+        """
+
+        grid = Grid(self.width, self.height, self.world)
+        grid._occupied = self._occupied.copy()
 
-        return deepcopy(self)
+        clones: dict[int, WorldObjT] = {}
+        for i, j in zip(*np.nonzero(self._occupied)):
+            obj = self.grid[i, j]
+            clone = clones.get(id(obj))
+            if clone is None:
+                clone = clones[id(obj)] = obj.clone()
+            grid.grid[i, j] = clone
+
+        return grid
 
     def set(self, i: int, j: int, v: WorldObjT | None) -> None:
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
-        self.grid[j * self.width + i] = v
+        self.grid[i, j] = v
+        self._occupied[i, j] = v is not None
 
     def get(self, i: int, j: int) -> WorldObjT | None:
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
-        return self.grid[j * self.width + i]
+        return self.grid[i, j]
+
+    def _fill(self, index: tuple | NDArray, v: WorldObjT | None) -> None:
+        """
+        Put the same object in every cell selected by a numpy index
+        """
+
+        self.grid[index] = v
+        self._occupied[index] = v is not None
 
     def horz_wall(
         self,
@@ -70,9 +192,22 @@ class Grid:
         length: int | None = None,
         obj_type: Type[WorldObjT] = Wall,
     ) -> None:
+        """
+        Place a horizontal wall of `length` cells starting at (x, y)
+
+        With the default `obj_type`, every cell holds the same `Wall` instance,
+        shared with the other grids of the world; it must not be mutated.
+        Other types get a new instance per cell.
+        """
+
         if length is None:
             length = self.width - x
         assert length is not None
+        if obj_type is Wall and length > 0:
+            assert x >= 0 and x + length <= self.width
+            assert y >= 0 and y < self.height
+            self._fill((slice(x, x + length), y), self._shared_wall())
+            return
         for i in range(0, length):
             self.set(x + i, y, obj_type(self.world))
 
@@ -82,9 +217,22 @@ class Grid:
         y: int,
         length: int | None = None,
         obj_type: Type[WorldObjT] = Wall,
-    ):
+    ) -> None:
+        """
+        Place a vertical wall of `length` cells starting at (x, y)
+
+        With the default `obj_type`, every cell holds the same `Wall` instance,
+        shared with the other grids of the world; it must not be mutated.
+        Other types get a new instance per cell.
+        """
+
         if length is None:
             length = self.height - y
+        if obj_type is Wall and length > 0:
+            assert x >= 0 and x < self.width
+            assert y >= 0 and y + length <= self.height
+            self._fill((x, slice(y, y + length)), self._shared_wall())
+            return
         for j in range(0, length):
             self.set(x, y + j, obj_type(self.world))
 
@@ -101,34 +249,85 @@ class Grid:
 
         grid = Grid(self.height, self.width, self.world)
 
-        for i in range(self.width):
-            for j in range(self.height):
-                v = self.get(i, j)
-                grid.set(j, grid.height - 1 - i, v)
+        # Cell (i, j) moves to (j, width - 1 - i)
+        grid.grid = np.rot90(self.grid, k=-1).copy()
+        grid._occupied = np.rot90(self._occupied, k=-1).copy()
 
         return grid
 
     def slice(self, topX, topY, width, height):
         """
         Get a subset of the grid
+
+        Cells are shared with this grid, and cells outside of it hold the
+        world's shared filler `Wall`, which must not be mutated.
         """
 
         grid = Grid(width, height, self.world)
 
-        for j in range(0, height):
-            for i in range(0, width):
-                x = topX + i
-                y = topY + j
+        # Overlap between the requested window and this grid
+        x0, x1 = max(topX, 0), min(topX + width, self.width)
+        y0, y1 = max(topY, 0), min(topY + height, self.height)
 
-                if x >= 0 and x < self.width and y >= 0 and y < self.height:
-                    v = self.get(x, y)
-                else:
-                    v = Wall(self.world)
+        # Cells outside of this grid are seen as walls
+        if x0 != topX or y0 != topY or x1 != topX + width or y1 != topY + height:
+            grid._fill((slice(None), slice(None)), self._shared_wall())
 
-                grid.set(i, j, v)
+        if x0 < x1 and y0 < y1:
+            src = (slice(x0, x1), slice(y0, y1))
+            dst = (slice(x0 - topX, x1 - topX), slice(y0 - topY, y1 - topY))
+            grid.grid[dst] = self.grid[src]
+            grid._occupied[dst] = self._occupied[src]
 
         return grid
 
+    def _shared_wall(self) -> Wall:
+        """
+        Wall instance shared by every grid of the same world, used as filler
+
+        The same instance fills many cells, so it must not be mutated.
+        """
+
+        if self.world.SHARED_WALL is None:
+            self.world.SHARED_WALL = Wall(self.world)
+        return self.world.SHARED_WALL
+
+    @staticmethod
+    def _tile_key(
+        obj: WorldObjT | None, highlights: list[bool], tile_size: int
+    ) -> int | tuple:
+        """
+        Key of a tile in the tile cache
+
+        Tile size, object encoding and highlights are packed into a single int
+        when every encoding field fits in 8 bits, the tile size in 16 bits and
+        highlights are non-negative and strictly increasing (highlights are
+        blended in order, so order and repeats matter); otherwise an exact
+        tuple key is used.
+        """
+
+        encoding = obj.encode() if obj is not None else ()
+        if not (
+            0 <= tile_size < 1 << 16
+            and all(0 <= v < 1 << 8 for v in encoding)
+            and all(h >= 0 for h in highlights)
+            and all(a < b for a, b in zip(highlights, highlights[1:]))
+        ):
+            return (tile_size, tuple(encoding), tuple(highlights))
+
+        key = tile_size
+        if obj is not None:
+            obj_key = 1
+            for v in encoding:
+                obj_key = (obj_key << 8) | int(v)
+            key |= obj_key << 16
+        if len(highlights) > 0:
+            highlight_bits = 0
+            for h in highlights:
+                highlight_bits |= 1 << int(h)
+            key |= highlight_bits << 80
+        return key
+
     @classmethod
     def render_tile(
         cls,
@@ -141,13 +340,21 @@ class Grid:
     ):
         """
         Render a tile and cache the result
+
+        The returned array is read-only and shared with every cell, frame and
+        caller rendering the same tile; copy it before drawing on it.
         """
 
-        key = (*highlights, tile_size)
-        key = obj.encode() + key if obj else key
+        # Empty cells without highlights are by far the most common tile
+        is_empty = obj is None and len(highlights) == 0
+        if is_empty and tile_size in cls.empty_tiles:
+            return cls.empty_tiles[tile_size]
 
-        if key in cls.tile_cache:
-            return cls.tile_cache[key]
+        key = cls._tile_key(obj, highlights, tile_size)
+        cached = cls.tile_cache.get(key)
+        if cached is not None:
+            cls.tile_cache.move_to_end(key)
+            return cached
 
         img = np.zeros(
             shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8
@@ -163,18 +370,25 @@ class Grid:
 
         # Highlight the cell  if needed
         if len(highlights) > 0:
+            colors = world.IDX_TO_RGB
             for h in highlights:
-                highlight_img(
-                    img,
-                    color=world.COLORS[world.IDX_TO_COLOR[h % len(world.IDX_TO_COLOR)]],
-                )
+                highlight_img(img, color=colors[h % len(colors)])
 
         # Downsample the image to perform supersampling/anti-aliasing
         img = downsample(img, subdivs)
 
+        # Tiles are shared between cells and frames: store them as read-only,
+        # contiguous uint8 arrays matching the frame layout
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        img.setflags(write=False)
+
         # Cache the rendered tile
-        if cache:
+        if cache and is_empty:
+            cls.empty_tiles[tile_size] = img
+        elif cache:
             cls.tile_cache[key] = img
+            if len(cls.tile_cache) > cls.tile_cache_maxsize:
+                cls.tile_cache.popitem(last=False)
         else:
             pass
 
@@ -193,30 +407,43 @@ class Grid:
         width_px = self.width * tile_size
         height_px = self.height * tile_size
 
-        img = np.zeros(shape=(height_px, width_px, 3), dtype=np.uint8)
-
-        # Render the grid
+        # Gather the distinct tiles and the index of the tile used by each cell
+        tiles: list[NDArray] = []
+        tile_ids: dict[int, int] = {}
+        tile_index = np.empty((self.height, self.width), dtype=np.intp)
+        grid, world, render_tile = self.grid, self.world, Grid.render_tile
         for j in range(0, self.height):
             for i in range(0, self.width):
-                cell = self.get(i, j)
+                cell = grid[i, j]
 
                 cache: bool = True
                 if cell is not None and cell.type in uncached_object_types:
                     cache = False
                 # agent_here = np.array_equal(agent_pos, (i, j))
-                tile_img = Grid.render_tile(
-                    self.world,
+                tile_img = render_tile(
+                    world,
                     cell,
                     highlights=[] if highlight_masks is None else highlight_masks[i, j],
                     tile_size=tile_size,
                     cache=cache,
                 )
 
-                ymin = j * tile_size
-                ymax = (j + 1) * tile_size
-                xmin = i * tile_size
-                xmax = (i + 1) * tile_size
-                img[ymin:ymax, xmin:xmax, :] = tile_img
+                idx = tile_ids.get(id(tile_img))
+                if idx is None:
+                    idx = len(tiles)
+                    tile_ids[id(tile_img)] = idx
+                    tiles.append(tile_img)
+                tile_index[j, i] = idx
+
+        tiles_arr = np.stack(tiles)
+        img = np.empty(shape=(height_px, width_px, 3), dtype=np.uint8)
+        if NUMBA_AVAILABLE:
+            _compose_tiles(img, tiles_arr, tile_index)
+        else:
+            # Gather the tiles straight into the frame, seen as
+            # (height, tile_size, width, tile_size, 3) blocks
+            blocks = img.reshape(self.height, tile_size, self.width, tile_size, 3)
+            blocks[...] = tiles_arr[tile_index].transpose(0, 2, 1, 3, 4)
 
         return img
 
@@ -232,22 +459,16 @@ class Grid:
             (self.width, self.height, self.world.encode_dim), dtype="uint8"
         )
 
-        for i in range(self.width):
-            for j in range(self.height):
-                if vis_mask[i, j]:
-                    v = self.get(i, j)
+        # Visible empty cells all share the precomputed empty encoding
+        empty_mask = vis_mask & ~self._occupied
+        if empty_mask.any():
+            assert self.world.EMPTY_ENCODING is not None, "no 'empty' object type"
+            array[empty_mask] = self.world.EMPTY_ENCODING
 
-                    if v is None:
-                        array[i, j, 0] = self.world.OBJECT_TO_IDX["empty"]
-                        array[i, j, 1] = 0
-                        array[i, j, 2] = 0
-                        if self.world.encode_dim > 3:
-                            array[i, j, 3] = 0
-                            array[i, j, 4] = 0
-                            array[i, j, 5] = 0
-
-                    else:
-                        array[i, j, :] = v.encode(self.world)
+        # Visible objects are written with a single fancy-index store
+        xs, ys = np.nonzero(vis_mask & self._occupied)
+        if len(xs) > 0:
+            array[xs, ys] = [self.grid[i, j].encode() for i, j in zip(xs, ys)]
 
         return array
 
@@ -255,69 +476,28 @@ class Grid:
         """
         Produce a compact numpy encoding of the grid
         """
-        if vis_mask is None:
-            vis_mask = np.ones((self.width, self.height), dtype=bool)
-
-        array = np.zeros(
-            (self.width, self.height, self.world.encode_dim), dtype="uint8"
-        )
+        array = self.encode(vis_mask)
 
-        for i in range(self.width):
-            for j in range(self.height):
-                if vis_mask[i, j]:
-                    v = self.get(i, j)
-
-                    if v is None:
-                        array[i, j, 0] = self.world.OBJECT_TO_IDX["empty"]
-                        array[i, j, 1] = 0
-                        array[i, j, 2] = 0
-                        if self.world.encode_dim > 3:
-                            array[i, j, 3] = 0
-                            array[i, j, 4] = 0
-                            array[i, j, 5] = 0
-
-                    else:
-                        array[i, j, :] = v.encode(
-                            current_agent=np.array_equal(agent_pos, (i, j))
-                        )
+        # Only the cell of the current agent differs from the plain encoding
+        ax, ay = int(agent_pos[0]), int(agent_pos[1])
+        if not (0 <= ax < self.width and 0 <= ay < self.height):
+            return array
+        if vis_mask is not None and not vis_mask[ax, ay]:
+            return array
+        if self._occupied[ax, ay]:
+            array[ax, ay] = self.grid[ax, ay].encode(current_agent=True)
 
         return array
 
     def process_vis(grid, agent_pos):
-        mask = np.zeros(shape=(grid.width, grid.height), dtype=bool)
-
-        mask[agent_pos[0], agent_pos[1]] = True
-
-        for j in reversed(range(0, grid.height)):
-            for i in range(0, grid.width - 1):
-                if not mask[i, j]:
-                    continue
-
-                cell = grid.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i + 1, j] = True
-                if j > 0:
-                    mask[i + 1, j - 1] = True
-                    mask[i, j - 1] = True
-
-            for i in reversed(range(1, grid.width)):
-                if not mask[i, j]:
-                    continue
-
-                cell = grid.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
+        # Occluders are evaluated here rather than cached in `set` since
+        # their state (e.g. an opened door) can change in place
+        see_behind = np.ones((grid.width, grid.height), dtype=bool)
+        for i, j in zip(*np.nonzero(grid._occupied)):
+            see_behind[i, j] = grid.get(i, j).see_behind()
 
-                mask[i - 1, j] = True
-                if j > 0:
-                    mask[i - 1, j - 1] = True
-                    mask[i, j - 1] = True
+        mask = _propagate_vis(see_behind, int(agent_pos[0]), int(agent_pos[1]))
 
-        for j in range(0, grid.height):
-            for i in range(0, grid.width):
-                if not mask[i, j]:
-                    grid.set(i, j, None)
+        grid._fill(~mask, None)
 
         return mask
@@ -1,3 +1,4 @@
+import copy
 from typing import TypeVar
 import numpy as np
 from numpy.typing import NDArray
@@ -55,7 +56,30 @@ class WorldObj:
         """Method to trigger/toggle an action this object performs"""
         return False
 
+    def __setattr__(self, name: str, value) -> None:
+        super().__setattr__(name, value)
+        # Any attribute change may alter the encoding: drop the cached one
+        self.__dict__.pop("_encoding", None)
+
     def encode(self, current_agent: bool = False) -> tuple[int, ...]:
+        """
+        Encode the a description of this object as a tuple of integers
+
+        The encoding computed by `_encode` is cached until an attribute of the
+        object is assigned. Changes made in place to objects it references
+        (e.g. recoloring a carried object) are not tracked: subclasses whose
+        encoding depends on other objects should override `encode` to bypass
+        the cache.
+        """
+        if current_agent:
+            return self._encode(current_agent)
+
+        encoding = self.__dict__.get("_encoding")
+        if encoding is None:
+            encoding = self.__dict__["_encoding"] = self._encode()
+        return encoding
+
+    def _encode(self, current_agent: bool = False) -> tuple[int, ...]:
         """Encode the a description of this object as a 3-tuple of integers"""
         if self.world.encode_dim == 3:
             return (
@@ -73,6 +97,10 @@ class WorldObj:
                 0,
             )
 
+    def clone(self: WorldObjT) -> WorldObjT:
+        """Shallow copy of this object, sharing the world and contained objects"""
+        return copy.copy(self)
+
     @staticmethod
     def decode(type_idx: int, color_idx: int, state: int):
         assert False, "not implemented"
@@ -235,7 +263,7 @@ class Door(WorldObj):
         self.is_open = not self.is_open
         return True
 
-    def encode(self, current_agent: bool = False):
+    def _encode(self, current_agent: bool = False):
         """Encode the a description of this object as a 3-tuple of integers"""
 
         # State, 0: open, 1: closed, 2: locked
@@ -1,10 +1,14 @@
-from typing import TypeVar
+from typing import TYPE_CHECKING, TypeVar
 from dataclasses import dataclass, field
 
+import numpy as np
 from numpy.typing import NDArray
 
 from .constants import COLORS
 
+if TYPE_CHECKING:
+    from .object import Wall
+
 WorldT = TypeVar("WorldT", bound="World")
 
 
@@ -17,6 +21,12 @@ class World:
     COLOR_TO_IDX: dict[str, int] = field(init=False)
     IDX_TO_COLOR: dict[int, str] = field(init=False)
     IDX_TO_OBJECT: dict[int, str] = field(init=False)
+    EMPTY_ENCODING: NDArray | None = field(init=False, repr=False, compare=False)
+    IDX_TO_RGB: list[NDArray] = field(init=False, repr=False, compare=False)
+    # Wall used as filler by grids of this world, created on first use
+    SHARED_WALL: "Wall | None" = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __post_init__(self):
         self.COLOR_TO_IDX = dict(
@@ -28,6 +38,15 @@ class World:
         self.IDX_TO_OBJECT = dict(
             zip(self.OBJECT_TO_IDX.values(), self.OBJECT_TO_IDX.keys())
         )
+        self.IDX_TO_RGB = [
+            self.COLORS[self.IDX_TO_COLOR[i]] for i in range(len(self.IDX_TO_COLOR))
+        ]
+        # Encoding shared by all empty cells
+        if "empty" in self.OBJECT_TO_IDX:
+            self.EMPTY_ENCODING = np.zeros(self.encode_dim, dtype=np.uint8)
+            self.EMPTY_ENCODING[0] = self.OBJECT_TO_IDX["empty"]
+        else:
+            self.EMPTY_ENCODING = None
 
 
 DefaultWorld = World(
@@ -0,0 +1,20 @@
+from typing import Callable
+
+try:
+    from numba import njit, prange
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    # numba is optional: fall back to running the kernels as plain Python
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs) -> Callable:
+        """No-op replacement for `numba.njit`"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(fn: Callable) -> Callable:
+            return fn
+
+        return decorator
@@ -0,0 +1,438 @@
+import importlib
+import sys
+from collections import OrderedDict
+
+import pytest
+import numpy as np
+
+import gym_multigrid.core.grid as grid_module
+import gym_multigrid.utils.jit as jit
+from gym_multigrid.core.agent import Agent
+from gym_multigrid.core.grid import Grid
+from gym_multigrid.core.object import Ball, Box, Door, Floor, Key, Wall, WorldObj
+from gym_multigrid.core.world import DefaultWorld
+from gym_multigrid.utils.rendering import fill_coords, point_in_rect
+
+
+def random_grid(seed: int, width: int = 9, height: int = 8) -> tuple[Grid, Agent]:
+    """Walled grid with doors, keys, balls, inner walls and an agent"""
+    rng = np.random.default_rng(seed)
+    grid = Grid(width, height, DefaultWorld)
+    grid.wall_rect(0, 0, width, height)
+
+    for _ in range(12):
+        i, j = rng.integers(1, width - 1), rng.integers(1, height - 1)
+        kind = rng.integers(5)
+        if kind == 0:
+            obj = Door(DefaultWorld, "red", is_open=bool(rng.integers(2)))
+        elif kind == 1:
+            obj = Key(DefaultWorld, "blue")
+        elif kind == 2:
+            obj = Wall(DefaultWorld)
+        elif kind == 3:
+            obj = Ball(DefaultWorld, index=1)
+        else:
+            obj = None
+        grid.set(i, j, obj)
+
+    agent = Agent(DefaultWorld, index=0)
+    agent.dir = int(rng.integers(4))
+    agent.pos = (int(rng.integers(1, width - 1)), int(rng.integers(1, height - 1)))
+    grid.set(*agent.pos, agent)
+
+    return grid, agent
+
+
+def loop_encode(grid: Grid, vis_mask=None, agent_pos=None) -> np.ndarray:
+    """Cell-by-cell encoding, as Grid.encode/encode_for_agents used to do it"""
+    array = np.zeros((grid.width, grid.height, DefaultWorld.encode_dim), np.uint8)
+    for i in range(grid.width):
+        for j in range(grid.height):
+            if vis_mask is not None and not vis_mask[i, j]:
+                continue
+            v = grid.get(i, j)
+            if v is None:
+                array[i, j, 0] = DefaultWorld.OBJECT_TO_IDX["empty"]
+            else:
+                current_agent = agent_pos is not None and (i, j) == tuple(agent_pos)
+                array[i, j, :] = v.encode(current_agent=current_agent)
+    return array
+
+
+def cells(grid: Grid) -> list[list]:
+    """Objects of the grid, indexed [i][j]"""
+    return [[grid.get(i, j) for j in range(grid.height)] for i in range(grid.width)]
+
+
+def test_contains_reads_live_attributes() -> None:
+    """Test Grid.__contains__ after type and color are reassigned in place"""
+    grid = Grid(5, 5, DefaultWorld)
+    floor = Floor(DefaultWorld, "blue")
+    grid.set(1, 1, floor)
+
+    floor.color = "red"
+    assert ("red", "floor") in grid
+    assert (None, "floor") in grid
+    assert ("blue", "floor") not in grid
+
+    floor.type = "wall"
+    assert floor in grid
+    assert ("red", "wall") in grid
+    assert Floor(DefaultWorld, "red") not in grid
+
+
+def test_eq_reads_live_attributes() -> None:
+    """Test Grid.__eq__ after an object is recolored in place"""
+    recolored = Grid(5, 5, DefaultWorld)
+    floor = Floor(DefaultWorld, "blue")
+    recolored.set(1, 1, floor)
+    floor.color = "red"
+
+    fresh = Grid(5, 5, DefaultWorld)
+    fresh.set(1, 1, Floor(DefaultWorld, "red"))
+    assert recolored == fresh
+
+    fresh.set(2, 2, Floor(DefaultWorld, "red"))
+    assert recolored != fresh
+
+
+def test_encode_reads_live_attributes() -> None:
+    """Test Grid.encode after an object is recolored in place"""
+    grid = Grid(5, 5, DefaultWorld)
+    floor = Floor(DefaultWorld, "blue")
+    grid.set(1, 1, floor)
+    floor.color = "red"
+
+    assert tuple(grid.encode()[1, 1]) == floor.encode()
+    assert grid.encode()[1, 1, 1] == DefaultWorld.COLOR_TO_IDX["red"]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_encode_matches_loop(seed: int) -> None:
+    """Test Grid.encode and Grid.encode_for_agents with doors and an agent"""
+    grid, agent = random_grid(seed)
+    vis_mask = np.random.default_rng(seed).random((grid.width, grid.height)) < 0.6
+    vis_mask[agent.pos] = True
+
+    assert np.array_equal(grid.encode(), loop_encode(grid))
+    assert np.array_equal(grid.encode(vis_mask), loop_encode(grid, vis_mask))
+    assert np.array_equal(
+        grid.encode_for_agents(agent.pos, vis_mask),
+        loop_encode(grid, vis_mask, agent.pos),
+    )
+    assert np.array_equal(
+        grid.encode_for_agents(agent.pos), loop_encode(grid, agent_pos=agent.pos)
+    )
+    assert grid.encode_for_agents(agent.pos)[agent.pos][5] == 1
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rotate_left_matches_loop(seed: int) -> None:
+    """Test that Grid.rotate_left moves cell (i, j) to (j, width - 1 - i)"""
+    grid, _ = random_grid(seed)
+    rotated = grid.rotate_left()
+
+    assert (rotated.width, rotated.height) == (grid.height, grid.width)
+    for i in range(grid.width):
+        for j in range(grid.height):
+            assert rotated.get(j, grid.width - 1 - i) is grid.get(i, j)
+    assert np.array_equal(rotated.encode(), loop_encode(rotated))
+
+    # The rotated grid does not alias the source
+    rotated.set(0, 0, None)
+    assert grid.get(0, grid.height - 1) is not None
+
+
+@pytest.mark.parametrize(
+    "top_x, top_y, width, height",
+    [(-2, 3, 7, 7), (4, -3, 7, 7), (20, 20, 5, 5), (0, 0, 9, 8), (-3, -3, 15, 14)],
+)
+def test_slice_matches_loop(top_x: int, top_y: int, width: int, height: int) -> None:
+    """Test Grid.slice, including the wall padding outside of the grid"""
+    grid, _ = random_grid(0)
+    sliced = grid.slice(top_x, top_y, width, height)
+
+    for i in range(width):
+        for j in range(height):
+            x, y = top_x + i, top_y + j
+            if 0 <= x < grid.width and 0 <= y < grid.height:
+                assert sliced.get(i, j) is grid.get(x, y)
+            else:
+                assert sliced.get(i, j).type == "wall"
+    assert np.array_equal(sliced.encode(), loop_encode(sliced))
+
+
+def loop_process_vis(grid: Grid, agent_pos: tuple[int, int]) -> np.ndarray:
+    """Visibility mask computed as Grid.process_vis used to do it"""
+    mask = np.zeros(shape=(grid.width, grid.height), dtype=bool)
+    mask[agent_pos[0], agent_pos[1]] = True
+
+    for j in reversed(range(0, grid.height)):
+        for i in range(0, grid.width - 1):
+            if not mask[i, j]:
+                continue
+            cell = grid.get(i, j)
+            if cell and not cell.see_behind():
+                continue
+            mask[i + 1, j] = True
+            if j > 0:
+                mask[i + 1, j - 1] = True
+                mask[i, j - 1] = True
+
+        for i in reversed(range(1, grid.width)):
+            if not mask[i, j]:
+                continue
+            cell = grid.get(i, j)
+            if cell and not cell.see_behind():
+                continue
+            mask[i - 1, j] = True
+            if j > 0:
+                mask[i - 1, j - 1] = True
+                mask[i, j - 1] = True
+
+    return mask
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_process_vis_matches_loop(seed: int) -> None:
+    """Test the Grid.process_vis mask and the clearing of hidden cells"""
+    grid, _ = random_grid(seed)
+    view = grid.slice(1, 0, 7, 7)
+    view.set(3, 6, None)
+    before = cells(view)
+
+    expected = loop_process_vis(view, (3, 6))
+    mask = view.process_vis((3, 6))
+
+    assert np.array_equal(mask, expected)
+    for i in range(view.width):
+        for j in range(view.height):
+            expected_cell = before[i][j] if expected[i, j] else None
+            assert view.get(i, j) is expected_cell
+    assert np.array_equal(view.encode(), loop_encode(view))
+
+
+def test_copy_clones_objects() -> None:
+    """Test that Grid.copy clones cell objects but shares what they reference"""
+    grid = Grid(6, 6, DefaultWorld)
+    grid.wall_rect(0, 0, 6, 6)
+    door = Door(DefaultWorld, "red")
+    ball = Ball(DefaultWorld, index=1)
+    box = Box(DefaultWorld, "green", contains=Key(DefaultWorld, "blue"))
+    agent = Agent(DefaultWorld, index=0)
+    agent.dir = 0
+    agent.carrying = Key(DefaultWorld, "red")
+    grid.set(1, 1, door)
+    grid.set(2, 1, ball)
+    grid.set(3, 1, box)
+    grid.set(4, 4, agent)
+    copy = grid.copy()
+
+    assert copy == grid
+    assert copy.get(1, 1) is not door
+    assert copy.get(2, 1) is not ball
+
+    # Mutating clones leaves the source grid untouched
+    copy.get(1, 1).is_open = True
+    copy.get(2, 1).pos = (-1, -1)
+    copy.set(4, 1, Key(DefaultWorld, "blue"))
+    assert not door.is_open
+    assert ball.pos is None
+    assert copy != grid
+
+    # Clones are shallow: referenced objects are shared with the source
+    assert copy.get(3, 1).contains is box.contains
+    assert copy.get(4, 4).carrying is agent.carrying
+
+    # Cells holding the same object still share a single clone
+    assert copy.get(0, 0) is copy.get(1, 0)
+
+
+def test_encoding_cache_invalidation() -> None:
+    """Test that cached object encodings follow in-place state changes"""
+    door = Door(DefaultWorld, "red", is_locked=True)
+    assert door.encode()[2] == 2
+    door.is_locked = False
+    assert door.encode()[2] == 1
+    door.toggle(None, (0, 0))
+    assert door.encode()[2] == 0
+
+    floor = Floor(DefaultWorld, "blue")
+    assert floor.encode()[1] == DefaultWorld.COLOR_TO_IDX["blue"]
+    floor.color = "red"
+    assert floor.encode()[1] == DefaultWorld.COLOR_TO_IDX["red"]
+
+    agent = Agent(DefaultWorld, index=0)
+    agent.dir = 0
+    assert agent.encode()[4] == 0
+    agent.dir = 3
+    assert agent.encode()[4] == 3
+
+    key = Key(DefaultWorld, "blue")
+    agent.carrying = key
+    assert agent.encode()[2:4] == (
+        DefaultWorld.OBJECT_TO_IDX["key"],
+        DefaultWorld.COLOR_TO_IDX["blue"],
+    )
+    key.color = "red"
+    assert agent.encode()[3] == DefaultWorld.COLOR_TO_IDX["red"]
+
+
+class Marker(WorldObj):
+    """Object whose encoding carries arbitrary integer fields"""
+
+    def __init__(self, a: int, b: int):
+        super().__init__(DefaultWorld, "floor", "blue")
+        self.a = a
+        self.b = b
+
+    def _encode(self, current_agent: bool = False):
+        return (self.world.OBJECT_TO_IDX[self.type], 0, self.a, self.b, 0, 0)
+
+    def render(self, img):
+        color = (self.a % 256, self.b % 256, 50)
+        fill_coords(img, point_in_rect(0, 1, 0, 1), color)
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [((1, 0), (0, 256)), ((-1, 0), (-1, 5)), ((3, 0), (3, 1))],
+)
+def test_tile_cache_keys_are_exact(first, second) -> None:
+    """Test that encodings overflowing the packed key get distinct tiles"""
+    tile_a = Grid.render_tile(DefaultWorld, Marker(*first), tile_size=8)
+    tile_b = Grid.render_tile(DefaultWorld, Marker(*second), tile_size=8)
+    assert not np.array_equal(tile_a, tile_b)
+
+
+@pytest.mark.parametrize("first, second", [([1, 2], [2, 1]), ([1, 1], [1])])
+def test_tile_cache_keys_follow_highlight_order(first, second) -> None:
+    """Test that highlight order and repeats are part of the tile key"""
+    ball = Ball(DefaultWorld, index=1)
+    tile_a = Grid.render_tile(DefaultWorld, ball, highlights=first, tile_size=8)
+    tile_b = Grid.render_tile(DefaultWorld, ball, highlights=second, tile_size=8)
+    fresh_b = Grid.render_tile(
+        DefaultWorld, ball, highlights=second, tile_size=8, cache=False
+    )
+
+    assert tile_a is not tile_b
+    assert np.array_equal(tile_b, fresh_b)
+    assert not np.array_equal(tile_a, tile_b)
+
+
+def test_filler_wall_is_shared() -> None:
+    """Test that walls and slice padding share the world's filler wall"""
+    grid = Grid(6, 6, DefaultWorld)
+    grid.wall_rect(0, 0, 6, 6)
+    sliced = grid.slice(-2, -2, 4, 4)
+
+    assert DefaultWorld.SHARED_WALL is not None
+    assert grid.get(0, 0) is DefaultWorld.SHARED_WALL
+    assert grid.get(5, 3) is DefaultWorld.SHARED_WALL
+    assert sliced.get(0, 0) is DefaultWorld.SHARED_WALL
+
+    grid.horz_wall(1, 2, 3, obj_type=Floor)
+    assert grid.get(1, 2) is not grid.get(2, 2)
+
+
+def test_jit_shim_without_numba(monkeypatch) -> None:
+    """Test the no-op njit and prange used when numba is not installed"""
+    monkeypatch.setitem(sys.modules, "numba", None)
+    try:
+        shim = importlib.reload(jit)
+        assert not shim.NUMBA_AVAILABLE
+        assert shim.prange is range
+
+        def fn(x: int) -> int:
+            return x + 1
+
+        assert shim.njit(fn) is fn
+        assert shim.njit(parallel=True, cache=True)(fn) is fn
+    finally:
+        monkeypatch.undo()
+        importlib.reload(jit)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_python_fallback_matches(seed: int, monkeypatch) -> None:
+    """Test process_vis and render on the plain Python path used without numba"""
+    grid, _ = random_grid(seed)
+    view = grid.slice(1, 0, 7, 7)
+    view.set(3, 6, None)
+    expected_img = view.render(tile_size=8)
+
+    monkeypatch.setattr(grid_module, "NUMBA_AVAILABLE", False)
+    for name in ("_propagate_vis", "_compose_tiles"):
+        kernel = getattr(grid_module, name)
+        monkeypatch.setattr(grid_module, name, getattr(kernel, "py_func", kernel))
+
+    assert np.array_equal(view.render(tile_size=8), expected_img)
+
+    img = np.empty_like(expected_img)
+    tiles = np.stack([Grid.render_tile(DefaultWorld, None, tile_size=8)] * 2)
+    tiles[1] = 255
+    tile_index = (np.arange(49) % 2).reshape(7, 7)
+    grid_module._compose_tiles(img, tiles, tile_index)
+    assert np.array_equal(
+        img.reshape(7, 8, 7, 8, 3).transpose(0, 2, 1, 3, 4), tiles[tile_index]
+    )
+
+    expected_mask = loop_process_vis(view, (3, 6))
+    assert np.array_equal(view.process_vis((3, 6)), expected_mask)
+
+
+def test_tile_cache_lru_bound(monkeypatch) -> None:
+    """Test that the tile cache is bounded and evicts the least recently used"""
+    monkeypatch.setattr(Grid, "tile_cache", OrderedDict())
+    monkeypatch.setattr(Grid, "tile_cache_maxsize", 4)
+
+    tiles = [
+        Grid.render_tile(DefaultWorld, Marker(a, 0), tile_size=8) for a in range(4)
+    ]
+    assert len(Grid.tile_cache) == 4
+
+    # A hit makes the tile the most recently used one
+    assert Grid.render_tile(DefaultWorld, Marker(0, 0), tile_size=8) is tiles[0]
+    for a in range(4, 6):
+        Grid.render_tile(DefaultWorld, Marker(a, 0), tile_size=8)
+    assert len(Grid.tile_cache) == 4
+
+    assert Grid.render_tile(DefaultWorld, Marker(0, 0), tile_size=8) is tiles[0]
+    assert Grid.render_tile(DefaultWorld, Marker(1, 0), tile_size=8) is not tiles[1]
+    assert len(Grid.tile_cache) == 4
+
+
+def test_empty_tiles_shortcut(monkeypatch) -> None:
+    """Test that empty tiles are rendered once per tile size"""
+    monkeypatch.setattr(Grid, "empty_tiles", {})
+
+    uncached = Grid.render_tile(DefaultWorld, None, tile_size=8, cache=False)
+    assert Grid.empty_tiles == {}
+
+    tile = Grid.render_tile(DefaultWorld, None, tile_size=8)
+    assert tile is not uncached
+    assert np.array_equal(tile, uncached)
+    assert Grid.render_tile(DefaultWorld, None, tile_size=8) is tile
+    assert Grid.empty_tiles[8] is tile
+
+    larger = Grid.render_tile(DefaultWorld, None, tile_size=16)
+    assert larger is not tile
+    assert larger.shape == (16, 16, 3)
+    assert Grid.render_tile(DefaultWorld, None, tile_size=16) is larger
+
+
+def test_tiles_are_read_only() -> None:
+    """Test that tiles are read-only while rendered frames stay writable"""
+    grid, _ = random_grid(0)
+    for obj in (None, grid.get(0, 0), Ball(DefaultWorld, index=1)):
+        assert not Grid.render_tile(DefaultWorld, obj, tile_size=8).flags.writeable
+        tile = Grid.render_tile(DefaultWorld, obj, tile_size=8, cache=False)
+        assert not tile.flags.writeable
+        with pytest.raises(ValueError):
+            tile[0, 0] = 0
+
+    img = grid.render(tile_size=8)
+    assert img.flags.writeable
+    empty = Grid.render_tile(DefaultWorld, None, tile_size=8).copy()
+    img[...] = 0
+    assert np.array_equal(Grid.render_tile(DefaultWorld, None, tile_size=8), empty)